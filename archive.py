@@ -0,0 +1,483 @@
+"""Columnar archive for cold ``sensor_readings`` history.
+
+Closed days are moved out of the database into one file per sensor and UTC
+day under ``SENSOR_ARCHIVE_DIR`` (``<sensor_id>/<YYYY-MM-DD>.sra``). A file is
+a small JSON header followed by zlib-compressed column blocks:
+
+- ``id``: int64 array, delta encoded
+- ``timestamp``: int64 microseconds since the day start, delta encoded
+- ``value``: float64 array
+- ``unit``: uint8 codes into the header's ``units`` list
+- ``is_present``: bit-packed flags (a missing flag is stored as ``False``)
+- ``keys``: JSON ``[sequence, idempotency_key]`` pairs, only written when a
+  reading in the day carries one
+
+Files are memory-mapped on read; the header alone answers whether a file
+overlaps the requested range, so non-overlapping days are never decompressed.
+"""
+
+import bisect
+import json
+import mmap
+import os
+import struct
+import sys
+import zlib
+from array import array
+from dataclasses import dataclass
+from datetime import date, datetime, time, timedelta, timezone
+from itertools import accumulate
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+import models
+from database import BASE_DIR, as_utc
+
+MAGIC = b"SRA1"
+PREAMBLE = struct.Struct("<4sI")
+FILE_SUFFIX = ".sra"
+DEFAULT_ARCHIVE_DIR = BASE_DIR / "archive"
+DELETE_BATCH_SIZE = 5000
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+@dataclass
+class ArchivedReading:
+    id: int
+    sensor_id: int
+    value: float
+    unit: str
+    is_present: bool
+    timestamp: datetime
+    sequence: Optional[int] = None
+    idempotency_key: Optional[str] = None
+
+
+def day_bounds(day: date) -> Tuple[datetime, datetime]:
+    start = datetime.combine(day, time.min, tzinfo=timezone.utc)
+    return start, start + timedelta(days=1)
+
+
+def to_micros(moment: datetime) -> int:
+    return (as_utc(moment) - EPOCH) // timedelta(microseconds=1)
+
+
+def from_micros(micros: int) -> datetime:
+    return EPOCH + timedelta(microseconds=micros)
+
+
+# -------------------------------
+# 🔹 Column encoding
+# -------------------------------
+
+
+def _little_endian(values: array) -> bytes:
+    if sys.byteorder == "big":
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+
+def _from_little_endian(typecode: str, data: bytes) -> array:
+    values = array(typecode)
+    values.frombytes(data)
+    if sys.byteorder == "big":
+        values.byteswap()
+    return values
+
+
+def delta_encode(values: List[int], base: int = 0) -> array:
+    deltas = array("q")
+    previous = base
+    for value in values:
+        deltas.append(value - previous)
+        previous = value
+    return deltas
+
+
+def delta_decode(deltas: Iterable[int], base: int = 0) -> List[int]:
+    return list(accumulate(deltas, initial=base))[1:]
+
+
+def pack_bits(flags: List[bool]) -> bytes:
+    packed = bytearray((len(flags) + 7) // 8)
+    for index, flag in enumerate(flags):
+        if flag:
+            packed[index >> 3] |= 1 << (index & 7)
+    return bytes(packed)
+
+
+# -------------------------------
+# 🔹 Day files
+# -------------------------------
+
+
+def encode_day(sensor_id: int, day: date, readings: List[ArchivedReading]) -> bytes:
+    readings = sorted(readings, key=lambda reading: (as_utc(reading.timestamp), reading.id))
+    day_start_us = to_micros(day_bounds(day)[0])
+    timestamps = [to_micros(reading.timestamp) for reading in readings]
+
+    units: List[str] = []
+    unit_codes = array("B")
+    for reading in readings:
+        if reading.unit not in units:
+            units.append(reading.unit)
+        unit_codes.append(units.index(reading.unit))
+
+    columns = {
+        "id": _little_endian(delta_encode([reading.id for reading in readings])),
+        "timestamp": _little_endian(delta_encode(timestamps, base=day_start_us)),
+        "value": _little_endian(array("d", (reading.value for reading in readings))),
+        "unit": unit_codes.tobytes(),
+        "is_present": pack_bits([bool(reading.is_present) for reading in readings]),
+    }
+    keys = [[reading.sequence, reading.idempotency_key] for reading in readings]
+    if any(sequence is not None or key is not None for sequence, key in keys):
+        columns["keys"] = json.dumps(keys, separators=(",", ":")).encode()
+
+    blocks = []
+    layout: Dict[str, List[int]] = {}
+    offset = 0
+    for name, raw in columns.items():
+        block = zlib.compress(raw, 6)
+        layout[name] = [offset, len(block)]
+        blocks.append(block)
+        offset += len(block)
+
+    header = json.dumps(
+        {
+            "sensor_id": sensor_id,
+            "day": day.isoformat(),
+            "count": len(readings),
+            "first_us": timestamps[0] if timestamps else day_start_us,
+            "last_us": timestamps[-1] if timestamps else day_start_us,
+            "units": units,
+            "columns": layout,
+        },
+        separators=(",", ":"),
+    ).encode()
+    return PREAMBLE.pack(MAGIC, len(header)) + header + b"".join(blocks)
+
+
+class DayFile:
+    """Read-only, memory-mapped view of one archived sensor day."""
+
+    def __init__(self, path: Path):
+        self.path = path
+        with open(path, "rb") as handle:
+            self._mmap = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, header_length = PREAMBLE.unpack_from(self._mmap, 0)
+        if magic != MAGIC:
+            self.close()
+            raise ValueError(f"{path} is not a sensor reading archive")
+        header_end = PREAMBLE.size + header_length
+        self.header = json.loads(self._mmap[PREAMBLE.size:header_end])
+        self._data_offset = header_end
+
+    def __enter__(self) -> "DayFile":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self._mmap.close()
+
+    @property
+    def count(self) -> int:
+        return self.header["count"]
+
+    def overlaps(self, since_us: Optional[int], until_us: Optional[int]) -> bool:
+        if self.count == 0:
+            return False
+        if since_us is not None and self.header["last_us"] < since_us:
+            return False
+        if until_us is not None and self.header["first_us"] >= until_us:
+            return False
+        return True
+
+    def _column(self, name: str) -> bytes:
+        offset, length = self.header["columns"][name]
+        start = self._data_offset + offset
+        with memoryview(self._mmap) as view:
+            return zlib.decompress(view[start:start + length])
+
+    def read(
+        self,
+        since_us: Optional[int] = None,
+        until_us: Optional[int] = None,
+        last: Optional[int] = None,
+    ) -> List[ArchivedReading]:
+        """Readings in ``[since_us, until_us)``, capped to the newest ``last``."""
+        if not self.overlaps(since_us, until_us):
+            return []
+
+        day_start_us = to_micros(day_bounds(date.fromisoformat(self.header["day"]))[0])
+        timestamps = delta_decode(
+            _from_little_endian("q", self._column("timestamp")), base=day_start_us
+        )
+        lower = 0 if since_us is None else bisect.bisect_left(timestamps, since_us)
+        upper = len(timestamps) if until_us is None else bisect.bisect_left(timestamps, until_us)
+        if last is not None:
+            lower = max(lower, upper - last)
+        if lower >= upper:
+            return []
+
+        ids = delta_decode(_from_little_endian("q", self._column("id")))
+        values = _from_little_endian("d", self._column("value"))
+        unit_codes = self._column("unit")
+        present = self._column("is_present")
+        units = self.header["units"]
+        sensor_id = self.header["sensor_id"]
+        keys = (
+            json.loads(self._column("keys"))
+            if "keys" in self.header["columns"]
+            else [[None, None]] * self.count
+        )
+
+        return [
+            ArchivedReading(
+                id=ids[index],
+                sensor_id=sensor_id,
+                value=values[index],
+                unit=units[unit_codes[index]],
+                is_present=bool(present[index >> 3] >> (index & 7) & 1),
+                timestamp=from_micros(timestamps[index]),
+                sequence=keys[index][0],
+                idempotency_key=keys[index][1],
+            )
+            for index in range(lower, upper)
+        ]
+
+
+# -------------------------------
+# 🔹 Archive directory
+# -------------------------------
+
+
+class ReadingArchive:
+    """Per-sensor, per-day archive files plus the queries that span them."""
+
+    def __init__(self, root: Path):
+        self.root = Path(root)
+        self._days_cache: Dict[int, Tuple[int, List[date]]] = {}
+
+    def sensor_dir(self, sensor_id: int) -> Path:
+        return self.root / str(sensor_id)
+
+    def day_path(self, sensor_id: int, day: date) -> Path:
+        return self.sensor_dir(sensor_id) / f"{day.isoformat()}{FILE_SUFFIX}"
+
+    def days(self, sensor_id: int) -> List[date]:
+        """Archived days for a sensor, oldest first.
+
+        Cached against the directory mtime so files written by the archiving
+        script in another process are picked up without rescanning every call.
+        """
+        directory = self.sensor_dir(sensor_id)
+        try:
+            mtime = directory.stat().st_mtime_ns
+        except FileNotFoundError:
+            self._days_cache.pop(sensor_id, None)
+            return []
+
+        cached = self._days_cache.get(sensor_id)
+        if cached and cached[0] == mtime:
+            return cached[1]
+
+        days = sorted(
+            date.fromisoformat(path.stem) for path in directory.glob(f"*{FILE_SUFFIX}")
+        )
+        self._days_cache[sensor_id] = (mtime, days)
+        return days
+
+    def archived_until(self, sensor_id: int) -> Optional[datetime]:
+        days = self.days(sensor_id)
+        return day_bounds(days[-1])[1] if days else None
+
+    def _days_in_range(
+        self,
+        sensor_id: int,
+        since: Optional[datetime],
+        until: Optional[datetime],
+    ) -> List[date]:
+        return [
+            day
+            for day in self.days(sensor_id)
+            if (since is None or day_bounds(day)[1] > as_utc(since))
+            and (until is None or day_bounds(day)[0] < as_utc(until))
+        ]
+
+    def iter_readings(
+        self,
+        sensor_id: int,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        newest_first: bool = False,
+    ) -> Iterator[ArchivedReading]:
+        """Stream archived readings in ``[since, until)``, one day at a time."""
+        since_us = None if since is None else to_micros(since)
+        until_us = None if until is None else to_micros(until)
+
+        days = self._days_in_range(sensor_id, since, until)
+        if newest_first:
+            days.reverse()
+
+        for day in days:
+            with DayFile(self.day_path(sensor_id, day)) as day_file:
+                readings = day_file.read(since_us, until_us)
+            if newest_first:
+                readings.reverse()
+            yield from readings
+
+    def newest(
+        self,
+        sensor_id: int,
+        limit: int,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+    ) -> List[ArchivedReading]:
+        since_us = None if since is None else to_micros(since)
+        until_us = None if until is None else to_micros(until)
+        readings: List[ArchivedReading] = []
+        for day in reversed(self._days_in_range(sensor_id, since, until)):
+            with DayFile(self.day_path(sensor_id, day)) as day_file:
+                newest_in_day = day_file.read(since_us, until_us, last=limit - len(readings))
+            readings.extend(reversed(newest_in_day))
+            if len(readings) >= limit:
+                break
+        return readings
+
+    def find_key(
+        self,
+        sensor_id: int,
+        moment: datetime,
+        idempotency_key: str,
+    ) -> Optional[ArchivedReading]:
+        """Look up an archived reading by key on the day ``moment`` falls in."""
+        day = as_utc(moment).date()
+        if day not in self.days(sensor_id):
+            return None
+        with DayFile(self.day_path(sensor_id, day)) as day_file:
+            if "keys" not in day_file.header["columns"]:
+                return None
+            return next(
+                (
+                    reading
+                    for reading in day_file.read()
+                    if reading.idempotency_key == idempotency_key
+                ),
+                None,
+            )
+
+    def write_day(self, sensor_id: int, day: date, readings: List[ArchivedReading]) -> int:
+        """Write (or merge into) a day file atomically; returns its row count."""
+        path = self.day_path(sensor_id, day)
+        merged = {reading.id: reading for reading in readings}
+        if path.exists():
+            with DayFile(path) as day_file:
+                for reading in day_file.read():
+                    merged.setdefault(reading.id, reading)
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = path.with_suffix(f"{FILE_SUFFIX}.tmp")
+        with open(temp_path, "wb") as handle:
+            handle.write(encode_day(sensor_id, day, list(merged.values())))
+            handle.flush()
+            os.fsync(handle.fileno())
+        os.replace(temp_path, path)
+        return len(merged)
+
+    def delete_sensor(self, sensor_id: int) -> int:
+        deleted = 0
+        for day in self.days(sensor_id):
+            path = self.day_path(sensor_id, day)
+            with DayFile(path) as day_file:
+                deleted += day_file.count
+            path.unlink()
+        self._days_cache.pop(sensor_id, None)
+        return deleted
+
+
+# -------------------------------
+# 🔹 Moving readings out of the database
+# -------------------------------
+
+
+def archive_closed_days(db: Session, archive: ReadingArchive, before: datetime) -> int:
+    """Move every reading from UTC days that ended before ``before`` into files.
+
+    Works one sensor day at a time so each query stays bounded, and jumps
+    straight to the next day that holds readings instead of stepping through
+    empty ones. Each sensor day is written and fsynced before its rows are
+    deleted, so an interrupted run loses nothing; rerunning merges by id
+    instead of duplicating.
+    """
+    cutoff = datetime.combine(as_utc(before).date(), time.min, tzinfo=timezone.utc)
+    sensor_ids = [sensor_id for (sensor_id,) in db.query(models.Sensor.id).order_by(models.Sensor.id)]
+
+    moved = 0
+    for sensor_id in sensor_ids:
+        cursor = None
+        while True:
+            next_query = db.query(func.min(models.SensorReading.timestamp)).filter(
+                models.SensorReading.sensor_id == sensor_id,
+                models.SensorReading.timestamp < cutoff,
+            )
+            if cursor is not None:
+                next_query = next_query.filter(models.SensorReading.timestamp >= cursor)
+            next_timestamp = next_query.scalar()
+            if next_timestamp is None:
+                break
+
+            end = min(day_bounds(as_utc(next_timestamp).date())[1], cutoff)
+            # Bound below by the previous window rather than the day start:
+            # nothing lies in between, and on SQLite a row stored exactly at
+            # midnight compares as text below a midnight bound parameter.
+            window = [
+                models.SensorReading.sensor_id == sensor_id,
+                models.SensorReading.timestamp < end,
+            ]
+            if cursor is not None:
+                window.append(models.SensorReading.timestamp >= cursor)
+            rows = db.query(models.SensorReading).filter(*window).all()
+
+            # Group by each row's own date rather than the window: SQLite
+            # compares timestamps as text, so rows sitting exactly on midnight
+            # can land in the neighbouring window.
+            groups: Dict[date, List[ArchivedReading]] = {}
+            for row in rows:
+                timestamp = as_utc(row.timestamp)
+                groups.setdefault(timestamp.date(), []).append(
+                    ArchivedReading(
+                        id=row.id,
+                        sensor_id=row.sensor_id,
+                        value=row.value,
+                        unit=row.unit,
+                        is_present=bool(row.is_present),
+                        timestamp=timestamp,
+                        sequence=row.sequence,
+                        idempotency_key=row.idempotency_key,
+                    )
+                )
+
+            for reading_day, readings in groups.items():
+                archive.write_day(sensor_id, reading_day, readings)
+                ids = [reading.id for reading in readings]
+                for offset in range(0, len(ids), DELETE_BATCH_SIZE):
+                    db.query(models.SensorReading).filter(
+                        *window,
+                        models.SensorReading.id.in_(ids[offset:offset + DELETE_BATCH_SIZE]),
+                    ).delete(synchronize_session=False)
+                moved += len(readings)
+            db.commit()
+            db.expunge_all()
+            cursor = end
+    return moved
+
+
+def build_archive() -> ReadingArchive:
+    return ReadingArchive(Path(os.getenv("SENSOR_ARCHIVE_DIR") or DEFAULT_ARCHIVE_DIR))
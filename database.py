@@ -1,7 +1,9 @@
 import os
+from datetime import datetime, timezone
 from pathlib import Path
 
-from sqlalchemy import create_engine
+from sqlalchemy import Table, create_engine, inspect, text
+from sqlalchemy.engine import Connection
 from sqlalchemy.orm import declarative_base, sessionmaker
 
 BASE_DIR = Path(__file__).resolve().parent
@@ -61,3 +63,34 @@ except ModuleNotFoundError as exc:
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 Base = declarative_base()
+
+
+def as_utc(moment: datetime) -> datetime:
+    """Return ``moment`` as an aware UTC datetime.
+
+    Every stored timestamp is UTC, but SQLite hands them back naive and
+    compares them as text, so values are normalised before they are compared
+    or written.
+    """
+    if moment.tzinfo is None:
+        return moment.replace(tzinfo=timezone.utc)
+    return moment.astimezone(timezone.utc)
+
+
+def add_missing_columns(connection: Connection, table: Table) -> list[str]:
+    """Add nullable columns that exist on the model but not yet in the database.
+
+    create_all() only creates missing tables, so this keeps existing installs
+    working when a model gains optional columns.
+    """
+    existing = {column["name"] for column in inspect(connection).get_columns(table.name)}
+    added = []
+    for column in table.columns:
+        if column.name in existing:
+            continue
+        column_type = column.type.compile(dialect=connection.dialect)
+        connection.execute(
+            text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}")
+        )
+        added.append(column.name)
+    return added
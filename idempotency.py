@@ -0,0 +1,71 @@
+"""Deduplication of retried sensor readings.
+
+A reading is idempotent when it carries an ``idempotency_key`` or a
+``sequence`` number. Keys seen recently are held in an in-process LRU so a
+retry is answered from memory; older ones fall through to the unique index
+on ``sensor_readings``.
+"""
+
+import os
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import Optional, Tuple
+
+from database import as_utc
+
+DEFAULT_CACHE_SIZE = 10000
+
+
+def reading_key(
+    idempotency_key: Optional[str],
+    sequence: Optional[int],
+    timestamp: Optional[datetime],
+) -> Optional[str]:
+    """Derive the stored ``idempotency_key`` for an incoming reading.
+
+    An explicit key wins. A sequence number is always qualified with the
+    device timestamp, so counters that restart or wrap after a gateway reboot
+    never collide with earlier readings; without a timestamp there is no key
+    (the ingest endpoint rejects that combination).
+    """
+    if idempotency_key:
+        return idempotency_key
+    if sequence is None or timestamp is None:
+        return None
+    return f"seq:{sequence}@{as_utc(timestamp).isoformat()}"
+
+
+class RecentReadingKeys:
+    """Bounded LRU of ``(sensor_id, key)`` to the stored reading's response."""
+
+    def __init__(self, capacity: int = DEFAULT_CACHE_SIZE):
+        self.capacity = capacity
+        self._entries: "OrderedDict[Tuple[int, str], dict]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, sensor_id: int, key: str) -> Optional[dict]:
+        with self._lock:
+            entry = self._entries.get((sensor_id, key))
+            if entry is not None:
+                self._entries.move_to_end((sensor_id, key))
+            return entry
+
+    def remember(self, sensor_id: int, key: str, reading: dict) -> None:
+        if self.capacity <= 0:
+            return
+        with self._lock:
+            self._entries[(sensor_id, key)] = reading
+            self._entries.move_to_end((sensor_id, key))
+            while len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+
+    def forget_sensor(self, sensor_id: int) -> None:
+        with self._lock:
+            for entry_key in [entry_key for entry_key in self._entries if entry_key[0] == sensor_id]:
+                del self._entries[entry_key]
+
+
+def build_recent_keys() -> RecentReadingKeys:
+    value = os.getenv("INGEST_DEDUP_CACHE_SIZE", "").strip()
+    return RecentReadingKeys(int(value) if value else DEFAULT_CACHE_SIZE)
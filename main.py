@@ -1,16 +1,26 @@
 import json
 import logging
+from datetime import datetime, timedelta, timezone
+from typing import Optional
 from fastapi import FastAPI, Depends, HTTPException, Query, WebSocket, WebSocketDisconnect
+from sqlalchemy import text
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
-from database import SessionLocal, engine, Base
+from database import SessionLocal, engine, Base, as_utc
 import models
 import schemas
+from archive import build_archive
+from idempotency import build_recent_keys, reading_key
+from partitioning import build_partitions, env_int, month_windows
 from fastapi.middleware.cors import CORSMiddleware
 
 # -------------------------------
 # 🔹 Database Initialization
 # -------------------------------
-Base.metadata.create_all(bind=engine)
+reading_partitions = build_partitions(engine)
+reading_partitions.create_schema(Base.metadata)
+reading_archive = build_archive()
+recent_reading_keys = build_recent_keys()
 
 app = FastAPI(title="Sensor API")
 
@@ -20,6 +30,10 @@ DEFAULT_SENSOR_NAME = "Temperature Sensor"
 DEFAULT_SENSOR_TYPE = "temperature"
 DEFAULT_SENSOR_LOCATION = "Digester"
 DEFAULT_SENSOR_UNIT = "°C"
+READINGS_PAGE_SIZE = 50
+# Bounds for device-supplied timestamps; each accepted month may create a partition.
+MAX_CLOCK_SKEW = timedelta(seconds=env_int("INGEST_MAX_CLOCK_SKEW_SECONDS", 300))
+MAX_BACKFILL = timedelta(days=env_int("INGEST_MAX_BACKFILL_DAYS", 366))
 
 app.add_middleware(
     CORSMiddleware,
@@ -143,7 +157,8 @@ manager = ConnectionManager()
 
 
 with SessionLocal() as startup_db:
-    ensure_single_temperature_sensor(startup_db)
+    # Lets ingest answer cached retries before it touches the database.
+    canonical_sensor_id = ensure_single_temperature_sensor(startup_db).id
 
 # -----------------------------
 # 🔹 Basic Route
@@ -164,9 +179,30 @@ def create_sensor(sensor: schemas.SensorCreate, db: Session = Depends(get_db)):
     return ensure_single_temperature_sensor(db)
 
 
+def reading_response(reading) -> dict:
+    """Response row for a live or archived reading, always with a UTC timestamp."""
+    response = schemas.SensorReadingResponse.model_validate(reading).model_dump()
+    response["timestamp"] = as_utc(response["timestamp"])
+    return response
+
+
+def build_sensor_with_readings(sensor: models.Sensor) -> dict:
+    """Sensor plus its full history, archived days first, then live rows."""
+    return {
+        "id": sensor.id,
+        "name": sensor.name,
+        "type": sensor.type,
+        "location": sensor.location,
+        "readings": [
+            reading_response(reading)
+            for reading in [*reading_archive.iter_readings(sensor.id), *sensor.readings]
+        ],
+    }
+
+
 @app.get("/api/sensors/", response_model=list[schemas.SensorWithReadings])
 def get_sensors(db: Session = Depends(get_db)):
-    return [ensure_single_temperature_sensor(db)]
+    return [build_sensor_with_readings(ensure_single_temperature_sensor(db))]
 
 
 @app.get("/api/sensors/{sensor_id}", response_model=schemas.SensorWithReadings)
@@ -174,7 +210,7 @@ def get_sensor(sensor_id: int, db: Session = Depends(get_db)):
     sensor = ensure_single_temperature_sensor(db)
     if sensor.id != sensor_id:
         raise HTTPException(status_code=404, detail="Sensor not found")
-    return sensor
+    return build_sensor_with_readings(sensor)
 
 
 @app.delete("/api/sensors/{sensor_id}", response_model=schemas.SensorResponse)
@@ -197,6 +233,8 @@ def delete_sensor_readings(sensor_id: int, db: Session = Depends(get_db)):
     deleted_count = db.query(models.SensorReading).filter(
         models.SensorReading.sensor_id == sensor_id).delete()
     db.commit()
+    deleted_count += reading_archive.delete_sensor(sensor_id)
+    recent_reading_keys.forget_sensor(sensor_id)
     return {"deleted_readings": deleted_count}
 
 # -----------------------------
@@ -204,17 +242,90 @@ def delete_sensor_readings(sensor_id: int, db: Session = Depends(get_db)):
 # -----------------------------
 
 
+def find_stored_reading(
+    db: Session,
+    sensor_id: int,
+    key: str,
+    timestamp: Optional[datetime],
+):
+    query = db.query(models.SensorReading).filter(
+        models.SensorReading.sensor_id == sensor_id,
+        models.SensorReading.idempotency_key == key,
+    )
+    if timestamp is not None and reading_partitions.enabled:
+        # Matches the partitioned unique index and prunes to one partition.
+        query = query.filter(models.SensorReading.timestamp == timestamp)
+    stored = query.first()
+    if stored is None and timestamp is not None:
+        stored = reading_archive.find_key(sensor_id, timestamp, key)
+    return stored
+
+
+def remember_reading(sensor_id: int, key: str, reading) -> dict:
+    response = (
+        reading
+        if isinstance(reading, dict)
+        else schemas.SensorReadingResponse.model_validate(reading).model_dump()
+    )
+    recent_reading_keys.remember(sensor_id, key, response)
+    return response
+
+
+def check_device_timestamp(timestamp: datetime) -> None:
+    now = datetime.now(timezone.utc)
+    if timestamp > now + MAX_CLOCK_SKEW:
+        raise HTTPException(
+            status_code=422,
+            detail="Reading timestamp is in the future",
+        )
+    if timestamp < now - MAX_BACKFILL or not reading_partitions.accepts(timestamp, now):
+        raise HTTPException(
+            status_code=422,
+            detail="Reading timestamp is older than the accepted backfill window",
+        )
+
+
+def lock_reading_key(db: Session, sensor_id: int, key: str) -> None:
+    """Serialise concurrent ingests of one key until this transaction ends.
+
+    Used where no unique index can reject the second insert, so a retry that
+    races the original waits here and then finds the stored copy.
+    """
+    db.execute(
+        text("SELECT pg_advisory_xact_lock(:sensor_id, hashtext(:key))"),
+        {"sensor_id": sensor_id, "key": key},
+    )
+
+
+def find_duplicate_reading(
+    db: Session,
+    sensor_id: int,
+    key: str,
+    timestamp: Optional[datetime],
+):
+    """Return the earlier copy of a retried reading, if there is one.
+
+    Recent keys are answered from memory before this runs. Otherwise the
+    unique index rejects the insert, except where it cannot see the retry:
+    partitioned tables (whose unique index includes the server-assigned
+    timestamp) and archived days.
+    """
+    stored = None
+    if timestamp is None and reading_partitions.enabled:
+        stored = find_stored_reading(db, sensor_id, key, timestamp)
+    elif timestamp is not None:
+        stored = reading_archive.find_key(sensor_id, timestamp, key)
+    return remember_reading(sensor_id, key, stored) if stored is not None else None
+
+
 @app.post("/api/sensors/data", response_model=schemas.SensorReadingResponse)
 async def ingest_data(
     reading: schemas.SensorReadingCreate,
     db: Session = Depends(get_db)
 ):
     """Receive sensor reading and broadcast to all WebSocket clients."""
-    sensor = ensure_single_temperature_sensor(db)
-
     # ✅ Set safe defaults for missing fields
     data = reading.model_dump()
-    data["sensor_id"] = sensor.id
 
     if data.get("value") is None:
         data["value"] = 0.0   # default or previous reading
@@ -222,6 +333,27 @@ async def ingest_data(
         data["unit"] = DEFAULT_SENSOR_UNIT
     if data.get("is_present") is None:
         data["is_present"] = True
+    if data.get("timestamp") is None:
+        data.pop("timestamp")   # stamped by the database on insert
+        if data.get("sequence") is not None and not data.get("idempotency_key"):
+            raise HTTPException(
+                status_code=422,
+                detail="A sequence number needs a device timestamp to deduplicate safely",
+            )
+    else:
+        data["timestamp"] = as_utc(data["timestamp"])
+        check_device_timestamp(data["timestamp"])
+    key = data["idempotency_key"] = reading_key(
+        data["idempotency_key"], data["sequence"], data.get("timestamp")
+    )
+
+    cached = recent_reading_keys.get(canonical_sensor_id, key) if key is not None else None
+    if cached is not None:
+        logger.info("Duplicate reading ignored: sensor_id=%s key=%s", canonical_sensor_id, key)
+        return cached
+
+    sensor = ensure_single_temperature_sensor(db)
+    data["sensor_id"] = sensor.id
 
     logger.info(
         "Incoming temperature reading received: value=%s unit=%s is_present=%s sensor_id=%s",
@@ -231,11 +363,41 @@ async def ingest_data(
         data["sensor_id"],
     )
 
+    # Partition DDL runs on its own connection, so it has to happen before this
+    # session reads sensor_readings or takes the key lock below.
+    if "timestamp" in data:
+        reading_partitions.ensure_month(data["timestamp"])
+    reading_partitions.maintain()
+
+    if key is not None:
+        if "timestamp" not in data and reading_partitions.enabled:
+            lock_reading_key(db, sensor.id, key)
+        duplicate = find_duplicate_reading(db, sensor.id, key, data.get("timestamp"))
+        if duplicate is not None:
+            db.rollback()   # releases the key lock
+            logger.info("Duplicate reading ignored: sensor_id=%s key=%s", sensor.id, key)
+            return duplicate
+
     db_reading = models.SensorReading(**data)
     db.add(db_reading)
-    db.commit()
+    try:
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        stored = (
+            find_stored_reading(db, sensor.id, key, data.get("timestamp"))
+            if key is not None
+            else None
+        )
+        if stored is None:
+            raise
+        logger.info("Duplicate reading ignored: sensor_id=%s key=%s", sensor.id, key)
+        return remember_reading(sensor.id, key, stored)
     db.refresh(db_reading)
 
+    if key is not None:
+        remember_reading(sensor.id, key, db_reading)
+
     realtime_sensor = build_realtime_sensor_payload(sensor, db_reading)
 
     # 🔹 Broadcast to all WebSocket clients
@@ -257,15 +419,76 @@ async def ingest_data(
     return db_reading
 
 
+def query_recent_readings(
+    db: Session,
+    sensor_id: int,
+    since: Optional[datetime],
+    until: Optional[datetime],
+) -> list[models.SensorReading]:
+    query = db.query(models.SensorReading).filter(
+        models.SensorReading.sensor_id == sensor_id
+    )
+    if since is not None:
+        since = as_utc(since)
+        query = query.filter(models.SensorReading.timestamp >= since)
+    if until is not None:
+        until = as_utc(until)
+        query = query.filter(models.SensorReading.timestamp < until)
+    query = query.order_by(models.SensorReading.timestamp.desc())
+
+    if not reading_partitions.enabled or since is not None:
+        return query.limit(READINGS_PAGE_SIZE).all()
+
+    # Walk back one monthly partition at a time so each query carries explicit
+    # timestamp bounds and the planner prunes it to a single child table.
+    readings: list[models.SensorReading] = []
+    newest = until or datetime.now(timezone.utc) + MAX_CLOCK_SKEW
+    floor = reading_partitions.oldest_month or newest
+    while True:
+        for start, end in month_windows(newest, floor):
+            readings.extend(
+                query.filter(
+                    models.SensorReading.timestamp >= start,
+                    models.SensorReading.timestamp < end,
+                )
+                .limit(READINGS_PAGE_SIZE - len(readings))
+                .all()
+            )
+            if len(readings) >= READINGS_PAGE_SIZE:
+                return readings
+
+        # The cached partition list is per process; another worker may have
+        # created an older month for a backfilled reading since it was read.
+        oldest = reading_partitions.refresh_months()
+        if oldest is None or oldest >= floor:
+            return readings
+        newest, floor = min(newest, floor), oldest
+
+
 @app.get("/api/sensors/{sensor_id}/readings", response_model=list[schemas.SensorReadingResponse])
-def get_readings(sensor_id: int, db: Session = Depends(get_db)):
-    return (
-        db.query(models.SensorReading)
-        .filter(models.SensorReading.sensor_id == sensor_id)
-        .order_by(models.SensorReading.timestamp.desc())
-        .limit(50)
-        .all()
+def get_readings(
+    sensor_id: int,
+    since: Optional[datetime] = Query(None),
+    until: Optional[datetime] = Query(None),
+    db: Session = Depends(get_db)
+):
+    readings = query_recent_readings(db, sensor_id, since, until)
+
+    # Only open archive files when the page is not already filled by readings
+    # newer than everything archived.
+    archived_until = reading_archive.archived_until(sensor_id)
+    if archived_until is None or (since is not None and as_utc(since) >= archived_until):
+        return [reading_response(reading) for reading in readings]
+    if len(readings) >= READINGS_PAGE_SIZE and as_utc(readings[-1].timestamp) >= archived_until:
+        return [reading_response(reading) for reading in readings]
+
+    archived = reading_archive.newest(sensor_id, READINGS_PAGE_SIZE, since, until)
+    merged = sorted(
+        readings + archived,
+        key=lambda reading: as_utc(reading.timestamp),
+        reverse=True,
     )
+    return [reading_response(reading) for reading in merged[:READINGS_PAGE_SIZE]]
 
 
 @app.get("/api/biogas-data", response_model=list[schemas.BiogasDataResponse])
@@ -1,6 +1,6 @@
 from database import Base
 from sqlalchemy.orm import relationship
-from sqlalchemy import Column, Integer, String, Float, ForeignKey, DateTime, func, Boolean
+from sqlalchemy import BigInteger, Column, Integer, String, Float, ForeignKey, DateTime, func, Boolean, Index
 
 
 class Sensor(Base):
@@ -16,6 +16,13 @@ class Sensor(Base):
 
 class SensorReading(Base):
     __tablename__ = "sensor_readings"
+    __table_args__ = (
+        # NULL keys never collide, so readings sent without one are unaffected.
+        Index("ux_sensor_readings_idempotency", "sensor_id", "idempotency_key", unique=True),
+        # Serves per-sensor time-range reads and archiving on the plain layout;
+        # the partitioned layout creates its own copy of this index.
+        Index("ix_sensor_readings_sensor_id_timestamp", "sensor_id", "timestamp"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     sensor_id = Column(Integer, ForeignKey("sensors.id"))
@@ -23,6 +30,8 @@ class SensorReading(Base):
     unit = Column(String, nullable=False)
     is_present = Column(Boolean, default=False)
     timestamp = Column(DateTime(timezone=True), server_default=func.now())
+    sequence = Column(BigInteger)
+    idempotency_key = Column(String)
     sensor = relationship("Sensor", back_populates="readings")
 
 
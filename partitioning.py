@@ -0,0 +1,405 @@
+"""Monthly range partitioning of ``sensor_readings`` for PostgreSQL.
+
+Opt in with ``SENSOR_READINGS_PARTITIONED=1`` on a PostgreSQL ``DATABASE_URL``.
+The parent table is partitioned by ``RANGE ("timestamp")`` with one child per
+calendar month (UTC) named ``sensor_readings_yYYYYmMM``. Future partitions are
+created ahead of time, and retention drops whole partitions instead of running
+row-level DELETEs. Existing installs convert with
+``scripts/partition_sensor_readings.py``.
+"""
+
+import logging
+import os
+import re
+import threading
+from datetime import datetime, timezone
+from typing import Iterator, List, Optional, Tuple
+
+from sqlalchemy import MetaData, inspect, text
+from sqlalchemy.engine import Connection, Engine
+
+from database import add_missing_columns, as_utc
+
+logger = logging.getLogger(__name__)
+
+TABLE_NAME = "sensor_readings"
+SEQUENCE_NAME = f"{TABLE_NAME}_id_seq"
+PARTITION_NAME_RE = re.compile(rf"^{TABLE_NAME}_y(\d{{4}})m(\d{{2}})$")
+
+# Index name -> (unique, plain-table columns, partitioned-table columns).
+# Partitioned tables require the partition key in every unique index, so the
+# database only catches retries that repeat the device timestamp there; the
+# ingest path looks up keys itself for readings stamped by the server.
+READING_INDEXES = {
+    f"ix_{TABLE_NAME}_sensor_id_timestamp": (
+        False,
+        'sensor_id, "timestamp"',
+        'sensor_id, "timestamp" DESC',
+    ),
+    f"ux_{TABLE_NAME}_idempotency": (
+        True,
+        "sensor_id, idempotency_key",
+        'sensor_id, idempotency_key, "timestamp"',
+    ),
+}
+
+
+def env_flag(name: str) -> bool:
+    return os.getenv(name, "").strip().lower() in {"1", "true", "yes", "on"}
+
+
+def env_int(name: str, default: int) -> int:
+    value = os.getenv(name, "").strip()
+    return int(value) if value else default
+
+
+# -------------------------------
+# 🔹 Month arithmetic
+# -------------------------------
+
+
+def month_start(moment: datetime) -> datetime:
+    moment = as_utc(moment)
+    return datetime(moment.year, moment.month, 1, tzinfo=timezone.utc)
+
+
+def add_months(month: datetime, months: int) -> datetime:
+    index = month.year * 12 + (month.month - 1) + months
+    return datetime(index // 12, index % 12 + 1, 1, tzinfo=timezone.utc)
+
+
+def partition_name(month: datetime) -> str:
+    return f"{TABLE_NAME}_y{month.year:04d}m{month.month:02d}"
+
+
+def parse_partition_name(name: str) -> Optional[datetime]:
+    match = PARTITION_NAME_RE.match(name)
+    if match is None:
+        return None
+    return datetime(int(match.group(1)), int(match.group(2)), 1, tzinfo=timezone.utc)
+
+
+def month_windows(
+    newest: datetime,
+    oldest: datetime,
+) -> Iterator[Tuple[datetime, datetime]]:
+    """Yield ``[start, end)`` month windows from ``newest`` back to ``oldest``.
+
+    Each window lines up with exactly one partition, so a query bounded by it
+    is pruned down to a single child table.
+    """
+    start = month_start(newest)
+    end = newest
+    floor = month_start(oldest)
+    while start >= floor:
+        if start < end:
+            yield start, end
+        end = start
+        start = add_months(start, -1)
+
+
+# -------------------------------
+# 🔹 DDL
+# -------------------------------
+
+
+def parent_table_ddl(table_name: str = TABLE_NAME) -> str:
+    # Partitioned tables require the partition key in every unique constraint,
+    # so the primary key becomes (id, timestamp). ids still come from the
+    # shared sequence and remain unique in practice.
+    return f"""
+        CREATE TABLE IF NOT EXISTS {table_name} (
+            id INTEGER NOT NULL DEFAULT nextval('{SEQUENCE_NAME}'),
+            sensor_id INTEGER REFERENCES sensors (id),
+            value DOUBLE PRECISION NOT NULL,
+            unit VARCHAR NOT NULL,
+            is_present BOOLEAN,
+            "timestamp" TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now(),
+            sequence BIGINT,
+            idempotency_key VARCHAR,
+            CONSTRAINT {table_name}_pkey PRIMARY KEY (id, "timestamp")
+        ) PARTITION BY RANGE ("timestamp")
+    """
+
+
+def create_parent_table(connection: Connection, table_name: str = TABLE_NAME) -> None:
+    """Create an empty partitioned parent with its indexes.
+
+    Only for new or staging tables: building an index here on a populated
+    table would block writers, see ``scripts/create_reading_indexes.py``.
+    """
+    connection.execute(text(f"CREATE SEQUENCE IF NOT EXISTS {SEQUENCE_NAME}"))
+    connection.execute(text(parent_table_ddl(table_name)))
+    for index_name, (unique, _, columns) in READING_INDEXES.items():
+        index_name = index_name.replace(TABLE_NAME, table_name, 1)
+        connection.execute(
+            text(
+                f"CREATE {'UNIQUE ' if unique else ''}INDEX IF NOT EXISTS {index_name} "
+                f"ON {table_name} ({columns})"
+            )
+        )
+
+
+def create_month_partition(
+    connection: Connection,
+    month: datetime,
+    table_name: str = TABLE_NAME,
+) -> str:
+    # Children keep their final names even when attached to a staging parent
+    # during migration, so only the parent needs renaming afterwards.
+    name = partition_name(month)
+    lower = month.isoformat()
+    upper = add_months(month, 1).isoformat()
+    connection.execute(
+        text(
+            f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {table_name} "
+            f"FOR VALUES FROM ('{lower}') TO ('{upper}')"
+        )
+    )
+    return name
+
+
+def is_partitioned(connection: Connection, table_name: str = TABLE_NAME) -> bool:
+    return bool(
+        connection.scalar(
+            text(
+                """
+                SELECT EXISTS (
+                    SELECT 1
+                    FROM pg_partitioned_table p
+                    JOIN pg_class c ON c.oid = p.partrelid
+                    WHERE c.relname = :table_name
+                      AND pg_table_is_visible(c.oid)
+                )
+                """
+            ),
+            {"table_name": table_name},
+        )
+    )
+
+
+def index_is_valid(connection: Connection, index_name: str) -> Optional[bool]:
+    """``None`` when the index is missing, ``False`` while it is unusable.
+
+    A failed ``CREATE INDEX CONCURRENTLY`` or a partitioned index that is not
+    attached to every partition yet is left behind as invalid.
+    """
+    return connection.scalar(
+        text(
+            """
+            SELECT i.indisvalid
+            FROM pg_class c
+            JOIN pg_index i ON i.indexrelid = c.oid
+            WHERE c.relname = :index_name
+              AND pg_table_is_visible(c.oid)
+            """
+        ),
+        {"index_name": index_name},
+    )
+
+
+def missing_reading_indexes(connection: Connection) -> List[str]:
+    if connection.dialect.name == "postgresql":
+        return [
+            name for name in READING_INDEXES if not index_is_valid(connection, name)
+        ]
+    existing = {index["name"] for index in inspect(connection).get_indexes(TABLE_NAME)}
+    return [name for name in READING_INDEXES if name not in existing]
+
+
+def list_partition_months(connection: Connection) -> List[datetime]:
+    rows = connection.execute(
+        text(
+            """
+            SELECT child.relname
+            FROM pg_inherits i
+            JOIN pg_class parent ON parent.oid = i.inhparent
+            JOIN pg_class child ON child.oid = i.inhrelid
+            WHERE parent.relname = :table_name
+              AND pg_table_is_visible(parent.oid)
+            """
+        ),
+        {"table_name": TABLE_NAME},
+    ).scalars()
+    months = [parse_partition_name(name) for name in rows]
+    return sorted(month for month in months if month is not None)
+
+
+def ensure_future_partitions(
+    connection: Connection,
+    now: datetime,
+    months_ahead: int,
+) -> datetime:
+    """Create partitions for the current month and ``months_ahead`` after it.
+
+    Returns the first month that is *not* covered yet.
+    """
+    current = month_start(now)
+    for offset in range(months_ahead + 1):
+        create_month_partition(connection, add_months(current, offset))
+    return add_months(current, months_ahead + 1)
+
+
+def drop_expired_partitions(
+    connection: Connection,
+    now: datetime,
+    retention_months: int,
+) -> List[str]:
+    """Detach and drop partitions that end before the retention cutoff."""
+    if retention_months <= 0:
+        return []
+
+    cutoff = add_months(month_start(now), -retention_months)
+    dropped = []
+    for month in list_partition_months(connection):
+        if add_months(month, 1) > cutoff:
+            continue
+        name = partition_name(month)
+        connection.execute(text(f"ALTER TABLE {TABLE_NAME} DETACH PARTITION {name}"))
+        connection.execute(text(f"DROP TABLE {name}"))
+        dropped.append(name)
+    return dropped
+
+
+# -------------------------------
+# 🔹 Runtime maintenance
+# -------------------------------
+
+
+def warn_missing_indexes(connection: Connection) -> None:
+    # Startup never builds indexes on an existing table: a plain CREATE INDEX
+    # blocks ingest for as long as the build takes.
+    missing = missing_reading_indexes(connection)
+    if missing:
+        logger.warning(
+            "%s is missing indexes %s; run scripts/create_reading_indexes.py. "
+            "Until then retries outside the in-memory cache are not deduplicated "
+            "and per-sensor reads scan the table.",
+            TABLE_NAME,
+            ", ".join(missing),
+        )
+
+
+class SensorReadingPartitions:
+    """Keeps the partition set ahead of ingest and within retention.
+
+    The ingest path calls :meth:`maintain` on every write; it only touches
+    the database when the calendar month moves past what was last prepared.
+    """
+
+    def __init__(
+        self,
+        engine: Engine,
+        enabled: bool,
+        months_ahead: int = 3,
+        retention_months: int = 0,
+    ):
+        self.engine = engine
+        self.enabled = enabled and engine.dialect.name == "postgresql"
+        self.months_ahead = max(months_ahead, 1)
+        self.retention_months = retention_months
+        self.months: List[datetime] = []
+        self._next_maintenance: Optional[datetime] = None
+        self._lock = threading.Lock()
+
+    def create_schema(self, metadata: MetaData) -> None:
+        """Create every table, using the partitioned layout for readings."""
+        readings_table = metadata.tables[TABLE_NAME]
+        if self.enabled:
+            other_tables = [
+                table for table in metadata.sorted_tables if table.name != TABLE_NAME
+            ]
+            metadata.create_all(bind=self.engine, tables=other_tables)
+
+            with self.engine.begin() as connection:
+                if not inspect(connection).has_table(TABLE_NAME):
+                    create_parent_table(connection)
+                    connection.execute(
+                        text(f"ALTER SEQUENCE {SEQUENCE_NAME} OWNED BY {TABLE_NAME}.id")
+                    )
+                elif is_partitioned(connection):
+                    add_missing_columns(connection, readings_table)
+                    warn_missing_indexes(connection)
+                else:
+                    logger.warning(
+                        "SENSOR_READINGS_PARTITIONED is set but %s is a plain table; "
+                        "run scripts/partition_sensor_readings.py to convert it.",
+                        TABLE_NAME,
+                    )
+                    self.enabled = False
+
+            if self.enabled:
+                self.maintain(force=True)
+                return
+
+        metadata.create_all(bind=self.engine)
+        with self.engine.begin() as connection:
+            add_missing_columns(connection, readings_table)
+            warn_missing_indexes(connection)
+
+    @property
+    def oldest_month(self) -> Optional[datetime]:
+        return self.months[0] if self.months else None
+
+    def refresh_months(self) -> Optional[datetime]:
+        """Re-read the partition list and return the oldest month."""
+        with self._lock:
+            with self.engine.connect() as connection:
+                self.months = list_partition_months(connection)
+        return self.oldest_month
+
+    def accepts(self, moment: datetime, now: Optional[datetime] = None) -> bool:
+        """Whether a reading stamped ``moment`` falls inside the retention window."""
+        if not self.enabled or self.retention_months <= 0:
+            return True
+        now = now or datetime.now(timezone.utc)
+        cutoff = add_months(month_start(now), -self.retention_months)
+        return month_start(moment) >= cutoff
+
+    def ensure_month(self, moment: datetime) -> None:
+        """Make sure a partition exists for a device-supplied timestamp."""
+        if not self.enabled:
+            return
+        month = month_start(moment)
+        if month in self.months:
+            return
+
+        with self._lock:
+            if month in self.months:
+                return
+            with self.engine.begin() as connection:
+                create_month_partition(connection, month)
+            self.months = sorted({*self.months, month})
+
+    def maintain(self, now: Optional[datetime] = None, force: bool = False) -> None:
+        if not self.enabled:
+            return
+
+        now = now or datetime.now(timezone.utc)
+        if not force and self._next_maintenance and now < self._next_maintenance:
+            return
+
+        with self._lock:
+            if not force and self._next_maintenance and now < self._next_maintenance:
+                return
+
+            with self.engine.begin() as connection:
+                ensure_future_partitions(connection, now, self.months_ahead)
+                dropped = drop_expired_partitions(
+                    connection, now, self.retention_months
+                )
+                months = list_partition_months(connection)
+
+            if dropped:
+                logger.info("Dropped expired reading partitions: %s", ", ".join(dropped))
+            self.months = months
+            self._next_maintenance = add_months(month_start(now), 1)
+
+
+def build_partitions(engine: Engine) -> SensorReadingPartitions:
+    return SensorReadingPartitions(
+        engine,
+        enabled=env_flag("SENSOR_READINGS_PARTITIONED"),
+        months_ahead=env_int("SENSOR_READINGS_PARTITION_MONTHS_AHEAD", 3),
+        retention_months=env_int("SENSOR_READINGS_RETENTION_MONTHS", 0),
+    )
@@ -30,6 +30,11 @@ class SensorReadingCreate(BaseModel):
     value: Optional[float] = None
     unit: Optional[str] = None
     is_present: Optional[bool] = True
+    # Device-side capture time; the server receive time is used when omitted.
+    timestamp: Optional[datetime] = None
+    # Either field makes retries of the same reading idempotent.
+    sequence: Optional[int] = None
+    idempotency_key: Optional[str] = Field(default=None, max_length=128)
 
 
 class SensorReadingResponse(SensorReadingCreate):
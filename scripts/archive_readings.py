@@ -0,0 +1,42 @@
+import argparse
+import sys
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(BASE_DIR))
+
+from archive import ReadingArchive, archive_closed_days, build_archive  # noqa: E402
+from database import SessionLocal  # noqa: E402
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Move closed days of sensor readings into columnar archive files."
+    )
+    parser.add_argument(
+        "--older-than-days",
+        type=int,
+        default=21,
+        help="Archive whole UTC days that ended at least this many days ago. Defaults to 21.",
+    )
+    parser.add_argument(
+        "--archive-dir",
+        help="Archive directory. Defaults to SENSOR_ARCHIVE_DIR or ./archive.",
+    )
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    archive = ReadingArchive(Path(args.archive_dir)) if args.archive_dir else build_archive()
+    before = datetime.now(timezone.utc) - timedelta(days=args.older_than_days)
+
+    with SessionLocal() as session:
+        moved = archive_closed_days(session, archive, before)
+
+    print(f"Archive complete: {moved} readings moved to {archive.root}.")
+
+
+if __name__ == "__main__":
+    main()
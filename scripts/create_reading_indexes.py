@@ -0,0 +1,141 @@
+import argparse
+import sys
+from pathlib import Path
+
+from sqlalchemy import text
+
+BASE_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(BASE_DIR))
+
+from database import engine  # noqa: E402
+from partitioning import (  # noqa: E402
+    READING_INDEXES,
+    TABLE_NAME,
+    index_is_valid,
+    is_partitioned,
+    list_partition_months,
+    missing_reading_indexes,
+    partition_name,
+)
+
+
+def create_index_concurrently(
+    connection,
+    index_name: str,
+    table_name: str,
+    unique: bool,
+    columns: str,
+) -> bool:
+    state = index_is_valid(connection, index_name)
+    if state:
+        return False
+    if state is False:
+        # Left behind by an interrupted CONCURRENTLY build; it is maintained on
+        # every write but never used, so rebuild it from scratch.
+        connection.execute(text(f"DROP INDEX CONCURRENTLY {index_name}"))
+    connection.execute(
+        text(
+            f"CREATE {'UNIQUE ' if unique else ''}INDEX CONCURRENTLY {index_name} "
+            f"ON {table_name} ({columns})"
+        )
+    )
+    return True
+
+
+def create_partitioned_index(connection, index_name: str, unique: bool, columns: str) -> bool:
+    # CONCURRENTLY is not available on a partitioned parent. Build each
+    # partition's index concurrently instead, then attach them to an index
+    # created ON ONLY the parent, which becomes valid once all are attached.
+    if index_is_valid(connection, index_name):
+        return False
+
+    connection.execute(
+        text(
+            f"CREATE {'UNIQUE ' if unique else ''}INDEX IF NOT EXISTS {index_name} "
+            f"ON ONLY {TABLE_NAME} ({columns})"
+        )
+    )
+    for month in list_partition_months(connection):
+        child = partition_name(month)
+        child_index = f"{index_name}_{child[len(TABLE_NAME) + 1:]}"
+        if index_is_valid(connection, child_index) is None and index_attached(
+            connection, index_name, child
+        ):
+            continue
+        create_index_concurrently(connection, child_index, child, unique, columns)
+        connection.execute(text(f"ALTER INDEX {index_name} ATTACH PARTITION {child_index}"))
+    return True
+
+
+def index_attached(connection, index_name: str, table_name: str) -> bool:
+    """Whether ``table_name`` already has an index attached to ``index_name``."""
+    return bool(
+        connection.scalar(
+            text(
+                """
+                SELECT EXISTS (
+                    SELECT 1
+                    FROM pg_inherits inh
+                    JOIN pg_class parent ON parent.oid = inh.inhparent
+                    JOIN pg_index child ON child.indexrelid = inh.inhrelid
+                    JOIN pg_class tbl ON tbl.oid = child.indrelid
+                    WHERE parent.relname = :index_name
+                      AND tbl.relname = :table_name
+                      AND pg_table_is_visible(parent.oid)
+                )
+                """
+            ),
+            {"index_name": index_name, "table_name": table_name},
+        )
+    )
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description=(
+            "Build the sensor_readings indexes without blocking ingest. "
+            "Uses the DATABASE_URL the API runs with."
+        )
+    )
+    return parser.parse_args()
+
+
+def main():
+    parse_args()
+    created = []
+
+    if engine.dialect.name != "postgresql":
+        # SQLite has no concurrent builds; it serialises writers anyway.
+        with engine.begin() as connection:
+            for index_name in missing_reading_indexes(connection):
+                unique, columns, _ = READING_INDEXES[index_name]
+                connection.execute(
+                    text(
+                        f"CREATE {'UNIQUE ' if unique else ''}INDEX {index_name} "
+                        f"ON {TABLE_NAME} ({columns})"
+                    )
+                )
+                created.append(index_name)
+    else:
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+            partitioned = is_partitioned(connection)
+            for index_name, (unique, plain_columns, partitioned_columns) in READING_INDEXES.items():
+                if partitioned:
+                    built = create_partitioned_index(
+                        connection, index_name, unique, partitioned_columns
+                    )
+                else:
+                    built = create_index_concurrently(
+                        connection, index_name, TABLE_NAME, unique, plain_columns
+                    )
+                if built:
+                    created.append(index_name)
+
+    if created:
+        print(f"Indexes ready on {TABLE_NAME}: {', '.join(created)}.")
+    else:
+        print(f"All {TABLE_NAME} indexes already exist.")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,16 @@
 import argparse
 from pathlib import Path
 
-from sqlalchemy import create_engine, func, select, text
-from sqlalchemy.orm import Session
+from sqlalchemy import create_engine, func, inspect, select, text
+from sqlalchemy.orm import Session, defer
 
 import models
 from database import Base, normalize_database_url
 
 BASE_DIR = Path(__file__).resolve().parents[1]
 DEFAULT_SOURCE_URL = f"sqlite:///{BASE_DIR / 'sensors.db'}"
+# Reading columns added after the original schema; older SQLite files lack them.
+OPTIONAL_READING_COLUMNS = ("sequence", "idempotency_key")
 
 
 def build_engine(database_url: str):
@@ -56,8 +58,21 @@ def copy_sensors(source_session: Session, target_session: Session) -> int:
 
 
 def copy_readings(source_session: Session, target_session: Session) -> int:
+    source_columns = {
+        column["name"]
+        for column in inspect(source_session.connection()).get_columns(
+            models.SensorReading.__tablename__
+        )
+    }
+    optional_columns = [name for name in OPTIONAL_READING_COLUMNS if name in source_columns]
+    missing_columns = [name for name in OPTIONAL_READING_COLUMNS if name not in source_columns]
+
     readings = source_session.scalars(
-        select(models.SensorReading).order_by(models.SensorReading.id)
+        select(models.SensorReading)
+        .options(
+            *(defer(getattr(models.SensorReading, name), raiseload=True) for name in missing_columns)
+        )
+        .order_by(models.SensorReading.id)
     ).all()
     for reading in readings:
         target_session.add(
@@ -68,6 +83,7 @@ def copy_readings(source_session: Session, target_session: Session) -> int:
                 unit=reading.unit,
                 is_present=reading.is_present,
                 timestamp=reading.timestamp,
+                **{name: getattr(reading, name) for name in optional_columns},
             )
         )
     return len(readings)